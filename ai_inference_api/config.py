@@ -3,6 +3,7 @@ Configuration settings for the inference API
 """
 
 import os
+import tempfile
 from typing import List
 from pydantic_settings import BaseSettings
 
@@ -14,6 +15,7 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     DEBUG: bool = False
+    UVICORN_WORKERS: int = 1
 
     # CORS settings
     ALLOWED_ORIGINS: str = (
@@ -24,13 +26,36 @@ class Settings(BaseSettings):
     MODEL_DIR: str = "models"
     BEAN_MODEL_PATH: str = os.path.join(MODEL_DIR, "bean_model.onnx")
     MAIZE_MODEL_PATH: str = os.path.join(MODEL_DIR, "maize_model.onnx")
+    USE_INT8: bool = True  # Prefer <model>.int8.onnx when present
+    # Prefer a pre-converted <model>.ort (ORT format) when present
+    USE_ORT_FORMAT: bool = True
+    # Serialize graph-optimized models to OPTIMIZED_MODEL_CACHE_DIR and
+    # reuse them (the models directory is usually mounted read-only)
+    CACHE_OPTIMIZED_MODELS: bool = True
+    OPTIMIZED_MODEL_CACHE_DIR: str = os.path.join(
+        tempfile.gettempdir(), "agriv-ort-cache"
+    )
+    # Run all sessions on one global thread pool and CPU arena allocator.
+    # Off by default: spinning can't be disabled for the global pool from
+    # Python, so idle threads busy-wait between requests
+    SHARE_ORT_RESOURCES: bool = False
 
     # Image processing
     MAX_IMAGE_SIZE: int = 10 * 1024 * 1024  # 10MB
     SUPPORTED_FORMATS: List[str] = ["jpg", "jpeg", "png"]
+    # Resize, normalize and transpose in one fused Numba pass (needs numba)
+    USE_FAST_PREPROCESS: bool = True
 
     # Model settings
     DEFAULT_MODEL: str = "bean"
+    # Group concurrent /predict requests into one model call. Off by
+    # default: it only pays off when batched inference is cheaper per image,
+    # i.e. with several cores per worker
+    ENABLE_MICRO_BATCHING: bool = False
+    MICRO_BATCH_MAX_SIZE: int = 16
+    MICRO_BATCH_MAX_WAIT_MS: float = 5.0
+    # Worker threads for preprocessing and inference (0 = usable CPUs per worker)
+    INFERENCE_THREADS: int = 0
 
     class Config:
         env_file = ".env"
@@ -4,18 +4,31 @@ Script to convert TensorFlow/Keras and PyTorch models to ONNX format
 Usage:
     python convert_models.py --keras models/Bean_Classifier_Best_Model.keras --output models/bean_model.onnx
     python convert_models.py --pytorch models/maize_model.pth --output models/maize_model.onnx
+    python convert_models.py --quantize --calibration-dir test_images/maize --output models/maize_model.onnx
+    python convert_models.py --quantize --output models/maize_model.onnx  # dynamic, no calibration
+
+To pre-convert a model to ORT format (loaded instead of the .onnx when present):
+    python -m onnxruntime.tools.convert_onnx_models_to_ort models/maize_model.onnx
 """
 
 import argparse
 import os
 import logging
+from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Opset 21 gives ORT its newer fused operators and constant-folding passes
+DEFAULT_OPSET = 21
+
 
 def convert_keras_to_onnx(
-    keras_model_path: str, output_path: str, input_shape: tuple = (1, 224, 224, 3)
+    keras_model_path: str,
+    output_path: str,
+    input_shape: tuple = (1, 224, 224, 3),
+    opset: int = DEFAULT_OPSET,
+    inputs_as_nchw: bool = False,
 ):
     """
     Convert Keras/TensorFlow model to ONNX
@@ -24,6 +37,9 @@ def convert_keras_to_onnx(
         keras_model_path: Path to Keras model file (.keras or .h5)
         output_path: Path to save ONNX model
         input_shape: Expected input shape (batch, height, width, channels)
+        opset: ONNX opset version (capped at the newest tf2onnx supports)
+        inputs_as_nchw: Export an NCHW input instead of the model's native
+            NHWC layout (adds a transpose to the graph)
     """
     try:
         import tensorflow as tf
@@ -54,10 +70,21 @@ def convert_keras_to_onnx(
         # Create spec for input
         input_signature = [tf.TensorSpec(input_shape, tf.float32, name="input")]
 
+        # Older tf2onnx releases don't know the newest opsets
+        max_opset = max(tf2onnx.constants.OPSET_TO_IR_VERSION)
+        if opset > max_opset:
+            logger.warning(f"tf2onnx supports up to opset {max_opset}, using that")
+            opset = max_opset
+
         # Convert
         onnx_model, _ = tf2onnx.convert.from_keras(
-            model, input_signature=input_signature, opset=13, output_path=output_path
+            model,
+            input_signature=input_signature,
+            opset=opset,
+            inputs_as_nchw=["input"] if inputs_as_nchw else None,
+            output_path=output_path,
         )
+        simplify_onnx_model(output_path)
 
         logger.info(f"✅ Successfully converted to ONNX: {output_path}")
         logger.info(f"   Input shape: {input_shape}")
@@ -81,6 +108,7 @@ def convert_pytorch_to_onnx(
     output_path: str,
     input_shape: tuple = (1, 3, 224, 224),
     model_class=None,
+    opset: int = DEFAULT_OPSET,
 ):
     """
     Convert PyTorch model to ONNX
@@ -90,6 +118,7 @@ def convert_pytorch_to_onnx(
         output_path: Path to save ONNX model
         input_shape: Expected input shape (batch, channels, height, width)
         model_class: PyTorch model class (if None, will try to load state dict)
+        opset: ONNX opset version
     """
     try:
         import torch
@@ -131,12 +160,13 @@ def convert_pytorch_to_onnx(
             dummy_input,
             output_path,
             export_params=True,
-            opset_version=13,
+            opset_version=opset,
             do_constant_folding=True,
             input_names=["input"],
             output_names=["output"],
             dynamic_axes={"input": {0: "batch_size"}, "output": {0: "batch_size"}},
         )
+        simplify_onnx_model(output_path)
 
         logger.info(f"✅ Successfully converted to ONNX: {output_path}")
         logger.info(f"   Input shape: {input_shape}")
@@ -155,6 +185,230 @@ def convert_pytorch_to_onnx(
         return False
 
 
+def simplify_onnx_model(model_path: str):
+    """
+    Run shape inference and, if onnxsim is installed, graph simplification
+    on an exported ONNX model in place
+
+    Args:
+        model_path: Path to ONNX model
+    """
+    import onnx
+
+    model = onnx.shape_inference.infer_shapes(onnx.load(model_path))
+
+    try:
+        import onnxsim
+
+        simplified, check = onnxsim.simplify(model)
+        if check:
+            model = simplified
+            logger.info("✅ Simplified ONNX graph with onnxsim")
+        else:
+            logger.warning("onnxsim output failed validation, keeping original graph")
+    except ImportError:
+        logger.info("onnxsim not installed, skipping graph simplification")
+
+    onnx.save(model, model_path)
+
+
+def _gemm_to_matmul(model):
+    """
+    Rewrite plain Gemm nodes (alpha=beta=1, no transA, constant weights) as
+    MatMul + Add, which ORT's dynamic quantizer can handle
+
+    Args:
+        model: ONNX ModelProto, modified in place
+    """
+    import onnx
+    from onnx import helper, numpy_helper
+
+    initializers = {init.name: init for init in model.graph.initializer}
+    transposed = {}
+    nodes = []
+    for node in model.graph.node:
+        attrs = {a.name: helper.get_attribute_value(a) for a in node.attribute}
+        if (
+            node.op_type != "Gemm"
+            or attrs.get("transA", 0)
+            or attrs.get("alpha", 1.0) != 1.0
+            or attrs.get("beta", 1.0) != 1.0
+            or node.input[1] not in initializers
+        ):
+            nodes.append(node)
+            continue
+
+        # MatMul has no transB, so use a pre-transposed copy of the weight;
+        # the original may be shared with other nodes, so it isn't touched
+        weight_name = node.input[1]
+        if attrs.get("transB", 0):
+            if weight_name not in transposed:
+                weight = numpy_helper.to_array(initializers[weight_name]).T.copy()
+                transposed[weight_name] = f"{weight_name}_transposed"
+                model.graph.initializer.append(
+                    numpy_helper.from_array(weight, transposed[weight_name])
+                )
+            weight_name = transposed[weight_name]
+
+        matmul_output = f"{node.output[0]}_matmul"
+        nodes.append(
+            helper.make_node(
+                "MatMul",
+                [node.input[0], weight_name],
+                [matmul_output],
+                name=f"{node.name}_MatMul",
+            )
+        )
+        if len(node.input) > 2 and node.input[2]:
+            nodes.append(
+                helper.make_node(
+                    "Add",
+                    [matmul_output, node.input[2]],
+                    [node.output[0]],
+                    name=f"{node.name}_Add",
+                )
+            )
+        else:
+            nodes[-1].output[0] = node.output[0]
+
+    del model.graph.node[:]
+    model.graph.node.extend(nodes)
+
+    # Drop original weights nothing refers to anymore (including nodes in
+    # subgraphs and graph inputs/outputs)
+    used = {value.name for value in model.graph.input}
+    used.update(value.name for value in model.graph.output)
+    graphs = [model.graph]
+    while graphs:
+        for node in graphs.pop().node:
+            used.update(node.input)
+            for attr in node.attribute:
+                if attr.type == onnx.AttributeProto.GRAPH:
+                    graphs.append(attr.g)
+                elif attr.type == onnx.AttributeProto.GRAPHS:
+                    graphs.extend(attr.graphs)
+
+    kept = [
+        init
+        for init in model.graph.initializer
+        if init.name in used or init.name not in transposed
+    ]
+    del model.graph.initializer[:]
+    model.graph.initializer.extend(kept)
+
+
+def quantize_onnx_model(
+    model_path: str,
+    output_path: str,
+    calibration_dir: Optional[str] = None,
+    num_samples: int = 100,
+):
+    """
+    Quantize an ONNX model to INT8
+
+    With calibration images this is QDQ static quantization of weights and
+    activations. Without, weights of MatMul/Gemm layers (e.g. the maize
+    model's large fully-connected layer) are quantized dynamically.
+
+    Args:
+        model_path: Path to FP32 ONNX model
+        output_path: Path to save INT8 ONNX model
+        calibration_dir: Directory of sample images used for calibration,
+            or None for dynamic quantization
+        num_samples: Maximum number of calibration images to use
+    """
+    try:
+        import onnx
+        import onnxruntime as ort
+        from onnxruntime.quantization import (
+            CalibrationDataReader,
+            QuantFormat,
+            QuantType,
+            quantize_dynamic,
+            quantize_static,
+        )
+        from utils.image_processing import preprocess_image_cv2
+
+        if calibration_dir is None:
+            logger.info(f"Dynamically quantizing {model_path} to INT8...")
+            model = onnx.load(model_path)
+            _gemm_to_matmul(model)
+            quantize_dynamic(
+                model,
+                output_path,
+                op_types_to_quantize=["MatMul"],
+                weight_type=QuantType.QInt8,
+            )
+            logger.info(f"✅ Successfully quantized to INT8: {output_path}")
+            logger.info(
+                f"   Model size: {os.path.getsize(output_path) / 1024 / 1024:.2f} MB"
+            )
+            return True
+
+        # Read input name/layout from the FP32 model
+        session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        model_input = session.get_inputs()[0]
+        if model_input.shape[-1] == 3:
+            layout = "NHWC"
+            target_size = tuple(model_input.shape[1:3])
+        else:
+            layout = "NCHW"
+            target_size = tuple(model_input.shape[2:4])
+
+        image_paths = sorted(
+            os.path.join(calibration_dir, name)
+            for name in os.listdir(calibration_dir)
+            if name.lower().endswith((".jpg", ".jpeg", ".png"))
+        )[:num_samples]
+        if not image_paths:
+            raise ValueError(f"No calibration images found in {calibration_dir}")
+
+        class ImageCalibrationReader(CalibrationDataReader):
+            """Feeds preprocessed sample images to the calibrator"""
+
+            def __init__(self):
+                self._paths = iter(image_paths)
+
+            def get_next(self):
+                path = next(self._paths, None)
+                if path is None:
+                    return None
+                with open(path, "rb") as f:
+                    image = preprocess_image_cv2(
+                        f.read(), target_size=target_size, layout=layout
+                    )
+                return {model_input.name: image}
+
+        logger.info(
+            f"Quantizing {model_path} to INT8 with {len(image_paths)} calibration images..."
+        )
+        quantize_static(
+            model_path,
+            output_path,
+            ImageCalibrationReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+
+        logger.info(f"✅ Successfully quantized to INT8: {output_path}")
+        logger.info(
+            f"   Model size: {os.path.getsize(output_path) / 1024 / 1024:.2f} MB"
+        )
+
+        return True
+
+    except ImportError as e:
+        logger.error(f"Missing dependencies: {e}")
+        logger.error(
+            "Install with: pip install onnx onnxruntime opencv-python-headless"
+        )
+        return False
+    except Exception as e:
+        logger.error(f"Quantization failed: {e}", exc_info=True)
+        return False
+
+
 def verify_onnx_model(model_path: str):
     """Verify ONNX model is valid"""
     try:
@@ -206,18 +460,54 @@ def main():
     )
     parser.add_argument("--input-height", type=int, default=224, help="Input height")
     parser.add_argument("--input-width", type=int, default=224, help="Input width")
+    parser.add_argument(
+        "--opset", type=int, default=DEFAULT_OPSET, help="ONNX opset version"
+    )
+    parser.add_argument(
+        "--nchw",
+        action="store_true",
+        help="Export Keras models with an NCHW input instead of native NHWC",
+    )
     parser.add_argument(
         "--verify", action="store_true", help="Verify ONNX model after conversion"
     )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also write an INT8 model (<output>.int8.onnx) after conversion",
+    )
+    parser.add_argument(
+        "--calibration-dir",
+        type=str,
+        help="Directory of sample images for INT8 calibration "
+        "(omit for dynamic quantization)",
+    )
+    parser.add_argument(
+        "--calibration-samples",
+        type=int,
+        default=100,
+        help="Maximum number of calibration images",
+    )
 
     args = parser.parse_args()
 
     if args.keras:
         input_shape = (1, args.input_height, args.input_width, 3)  # NHWC
-        success = convert_keras_to_onnx(args.keras, args.output, input_shape)
+        success = convert_keras_to_onnx(
+            args.keras,
+            args.output,
+            input_shape,
+            opset=args.opset,
+            inputs_as_nchw=args.nchw,
+        )
     elif args.pytorch:
         input_shape = (1, 3, args.input_height, args.input_width)  # NCHW
-        success = convert_pytorch_to_onnx(args.pytorch, args.output, input_shape)
+        success = convert_pytorch_to_onnx(
+            args.pytorch, args.output, input_shape, opset=args.opset
+        )
+    elif args.quantize and os.path.exists(args.output):
+        # Quantize an already exported ONNX model
+        success = True
     else:
         parser.error("Either --keras or --pytorch must be specified")
         return
@@ -225,6 +515,14 @@ def main():
     if success and args.verify:
         verify_onnx_model(args.output)
 
+    if success and args.quantize:
+        int8_path = args.output.replace(".onnx", ".int8.onnx")
+        success = quantize_onnx_model(
+            args.output, int8_path, args.calibration_dir, args.calibration_samples
+        )
+        if success and args.verify:
+            verify_onnx_model(int8_path)
+
 
 if __name__ == "__main__":
     main()
@@ -4,17 +4,24 @@ Uses ONNX Runtime for efficient inference
 """
 
 import os
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Dict, Any
+from functools import partial
+from typing import Dict, Any, Optional
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
+import numpy as np
 import uvicorn
 
-from models.inference import ModelInference
-from utils.image_processing import preprocess_image
+from models.inference import ModelInference, _effective_cpus
+from utils.image_processing import preprocess_image_turbo
+from utils.fast_preprocess import preprocess_image_fast
+from utils.batching import MicroBatcher
 from config import settings
 
 # Configure logging
@@ -25,6 +32,8 @@ logger = logging.getLogger(__name__)
 
 # Global model inference instance
 model_inference = None
+# Groups concurrent single-image predictions (None when disabled)
+batcher = None
 
 
 @asynccontextmanager
@@ -33,22 +42,48 @@ async def lifespan(app: FastAPI):
     Lifecycle manager for FastAPI application
     Loads models on startup and cleans up on shutdown
     """
-    global model_inference
+    global model_inference, batcher
 
     logger.info("Starting up inference API...")
 
+    # Bounded pool for preprocessing and inference, so a burst of requests
+    # can't pile up unlimited blocking work; sized like ORT's thread pools
+    # from the CPUs this worker may actually use
+    app.state.predict_pool = ThreadPoolExecutor(
+        max_workers=settings.INFERENCE_THREADS
+        or max(1, _effective_cpus() // settings.UVICORN_WORKERS),
+        thread_name_prefix="inference",
+    )
+
     try:
         # Initialize model inference
         model_inference = ModelInference()
         logger.info("✅ Models loaded successfully")
+
+        # Warm up sessions so first-request latency matches steady state,
+        # including the batch sizes the micro-batcher and /predict/batch use
+        model_inference.warmup(batch_sizes=(1, settings.MICRO_BATCH_MAX_SIZE))
     except Exception as e:
         logger.error(f"❌ Failed to load models: {e}")
         raise
 
+    if settings.ENABLE_MICRO_BATCHING:
+        batcher = MicroBatcher(
+            model_inference.predict_batch,
+            executor=app.state.predict_pool,
+            max_batch_size=settings.MICRO_BATCH_MAX_SIZE,
+            max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+        )
+        batcher.start()
+
     yield
 
     # Cleanup on shutdown
     logger.info("Shutting down inference API...")
+    if batcher:
+        await batcher.stop()
+        batcher = None
+    app.state.predict_pool.shutdown(wait=True)
     if model_inference:
         model_inference.cleanup()
 
@@ -59,6 +94,7 @@ app = FastAPI(
     description="AI-powered crop disease detection and classification using ONNX Runtime",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
@@ -104,6 +140,82 @@ async def health_check():
     }
 
 
+# Magic bytes of the accepted image formats
+IMAGE_SIGNATURES = (
+    b"\xff\xd8\xff",  # JPEG
+    b"\x89PNG",  # PNG
+)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Decode + resize + normalize used by both prediction endpoints
+preprocess = (
+    preprocess_image_fast if settings.USE_FAST_PREPROCESS else preprocess_image_turbo
+)
+
+
+async def _read_image_upload(file: UploadFile) -> bytes:
+    """
+    Read an uploaded image in chunks, aborting as soon as it exceeds
+    MAX_IMAGE_SIZE and rejecting content that isn't JPEG or PNG
+    """
+    buffer = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        buffer.extend(chunk)
+        if len(buffer) > settings.MAX_IMAGE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image too large. Maximum size is "
+                f"{settings.MAX_IMAGE_SIZE / 1024 / 1024:.1f}MB",
+            )
+
+    if not buffer.startswith(IMAGE_SIGNATURES):
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported image content. Please upload a JPG or PNG image.",
+        )
+
+    return bytes(buffer)
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the inference thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        app.state.predict_pool, partial(func, *args, **kwargs)
+    )
+
+
+# Per-thread input tensors for the unbatched path, one per model
+_input_buffers = threading.local()
+
+
+def _preprocess_upload(
+    image_bytes: bytes, model_name: str, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Preprocess an image for a model (blocking, runs in a worker thread)"""
+    return preprocess(
+        image_bytes,
+        target_size=model_inference.get_input_size(model_name),
+        layout=model_inference.get_input_layout(model_name),
+        out=out,
+    )
+
+
+def _run_inference(image_bytes: bytes, model_name: str) -> Dict[str, Any]:
+    """Preprocess an image and run inference (blocking, runs in a worker thread)"""
+    # Preprocessing and inference finish on this thread before it takes
+    # another request, so the input tensor can be reused
+    buffers = getattr(_input_buffers, "by_model", None)
+    if buffers is None:
+        buffers = _input_buffers.by_model = {}
+
+    processed_image = _preprocess_upload(
+        image_bytes, model_name, buffers.get(model_name)
+    )
+    buffers[model_name] = processed_image
+    return model_inference.predict(processed_image, model_name)
+
+
 @app.post("/predict")
 async def predict(
     file: UploadFile = File(...), model_name: str = "bean"
@@ -128,19 +240,22 @@ async def predict(
             detail=f"Invalid file type: {file.content_type}. Please upload an image file.",
         )
 
+    # Read image file (size-capped, rejects non-JPEG/PNG content)
+    image_bytes = await _read_image_upload(file)
+
     try:
         logger.info(f"Processing image: {file.filename} with model: {model_name}")
 
-        # Read image file
-        image_bytes = await file.read()
-
-        # Preprocess image
-        processed_image = preprocess_image(
-            image_bytes, target_size=model_inference.get_input_size(model_name)
-        )
-
-        # Run inference
-        result = model_inference.predict(processed_image, model_name)
+        # Preprocess and run inference off the event loop, batched with
+        # concurrent requests when micro-batching is enabled (models with a
+        # fixed batch of one gain nothing from it)
+        if batcher and model_inference.supports_batching(model_name):
+            processed_image = await _run_blocking(
+                _preprocess_upload, image_bytes, model_name
+            )
+            result = await batcher.predict(processed_image, model_name)
+        else:
+            result = await _run_blocking(_run_inference, image_bytes, model_name)
 
         # Add metadata
         result["model"] = model_name
@@ -183,32 +298,93 @@ async def predict_batch(
     results = []
     errors = []
 
+    # Validate file types
+    valid_files = []
     for file in files:
-        try:
-            # Validate file type
-            if not file.content_type.startswith("image/"):
-                errors.append(
-                    {
-                        "filename": file.filename,
-                        "error": f"Invalid file type: {file.content_type}",
-                    }
-                )
-                continue
-
-            # Read and process image
-            image_bytes = await file.read()
-            processed_image = preprocess_image(
-                image_bytes, target_size=model_inference.get_input_size(model_name)
+        if not file.content_type.startswith("image/"):
+            errors.append(
+                {
+                    "filename": file.filename,
+                    "error": f"Invalid file type: {file.content_type}",
+                }
             )
+        else:
+            valid_files.append(file)
 
-            # Run inference
-            result = model_inference.predict(processed_image, model_name)
-            result["filename"] = file.filename
-            results.append(result)
+    try:
+        target_size = model_inference.get_input_size(model_name)
+        layout = model_inference.get_input_layout(model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Read all uploads (size-capped), then preprocess them off the event loop
+    uploads = await asyncio.gather(
+        *(_read_image_upload(file) for file in valid_files), return_exceptions=True
+    )
+
+    read_files = []
+    images_bytes = []
+    for file, upload in zip(valid_files, uploads):
+        if isinstance(upload, Exception):
+            errors.append(
+                {
+                    "filename": file.filename,
+                    "error": getattr(upload, "detail", str(upload)),
+                }
+            )
+        else:
+            read_files.append(file)
+            images_bytes.append(upload)
+
+    # Each image is preprocessed straight into its row of one batch array
+    height, width = target_size
+    if layout == "NHWC":
+        batch = np.empty((len(images_bytes), height, width, 3), dtype=np.float32)
+    else:
+        batch = np.empty((len(images_bytes), 3, height, width), dtype=np.float32)
+
+    processed = await asyncio.gather(
+        *(
+            _run_blocking(
+                preprocess,
+                image_bytes,
+                target_size=target_size,
+                layout=layout,
+                out=batch[i : i + 1],
+            )
+            for i, image_bytes in enumerate(images_bytes)
+        ),
+        return_exceptions=True,
+    )
 
+    batch_files = []
+    batch_rows = []
+    for i, (file, processed_image) in enumerate(zip(read_files, processed)):
+        if isinstance(processed_image, Exception):
+            logger.error(f"Error processing {file.filename}: {processed_image}")
+            errors.append({"filename": file.filename, "error": str(processed_image)})
+        else:
+            batch_files.append(file)
+            batch_rows.append(i)
+
+    # Drop rows that failed to preprocess (copies only in that case)
+    if len(batch_rows) < len(batch):
+        batch = batch[batch_rows]
+
+    # Run inference on the whole batch at once
+    if batch_rows:
+        try:
+            batch_results = await _run_blocking(
+                model_inference.predict_batch, batch, model_name
+            )
+            for file, result in zip(batch_files, batch_results):
+                result["filename"] = file.filename
+                results.append(result)
         except Exception as e:
-            logger.error(f"Error processing {file.filename}: {e}")
-            errors.append({"filename": file.filename, "error": str(e)})
+            logger.error(f"Batch inference error: {e}")
+            errors.extend(
+                {"filename": file.filename, "error": str(e)} for file in batch_files
+            )
 
     return {
         "model": model_name,
@@ -249,4 +425,5 @@ if __name__ == "__main__":
         port=settings.PORT,
         reload=settings.DEBUG,
         log_level="info",
+        loop="uvloop",
     )
@@ -3,14 +3,93 @@ Model inference using ONNX Runtime
 """
 
 import os
+import hashlib
 import logging
+import threading
+import time
 from typing import Dict, Any, Tuple, Optional
 import numpy as np
 import onnxruntime as ort
 
+from config import settings
+
 logger = logging.getLogger(__name__)
 
 
+def _effective_cpus() -> int:
+    """
+    Number of CPUs this process can actually use, honouring CPU affinity
+    and cgroup (container) CPU quotas rather than the host core count
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota_str, period_str = f.read().split()
+        if quota_str != "max":
+            quota, period = int(quota_str), int(period_str)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: quota is -1 when unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None and period and quota > 0:
+        cpus = min(cpus, max(1, -(-quota // period)))
+
+    return min(cpus, os.cpu_count() or cpus)
+
+
+# Global ORT thread pools can only be created once per process
+_shared_resources_lock = threading.Lock()
+_shared_resources_ready: Optional[bool] = None
+
+
+def _init_shared_resources() -> bool:
+    """
+    Create the process-wide ORT thread pools and CPU arena allocator that
+    sessions share instead of each allocating their own
+
+    Returns:
+        True if sessions can use the shared resources
+    """
+    global _shared_resources_ready
+
+    with _shared_resources_lock:
+        if _shared_resources_ready is not None:
+            return _shared_resources_ready
+
+        try:
+            ort.set_global_thread_pool_sizes(
+                max(1, _effective_cpus() // settings.UVICORN_WORKERS), 1
+            )
+            ort.create_and_register_allocator(
+                ort.OrtMemoryInfo(
+                    "Cpu",
+                    ort.OrtAllocatorType.ORT_ARENA_ALLOCATOR,
+                    0,
+                    ort.OrtMemType.DEFAULT,
+                ),
+                None,
+            )
+            _shared_resources_ready = True
+        except Exception as e:
+            # The ORT environment already exists without global pools
+            logger.warning(f"Shared ORT resources unavailable, using per-session: {e}")
+            _shared_resources_ready = False
+
+        return _shared_resources_ready
+
+
 class ModelInference:
     """
     Handles model loading and inference using ONNX Runtime
@@ -20,17 +99,162 @@ class ModelInference:
         """Initialize inference engine and load models"""
         self.models: Dict[str, ort.InferenceSession] = {}
         self.model_metadata: Dict[str, Dict[str, Any]] = {}
+        # IOBindings and output buffers are reused, but requests run on
+        # worker threads, so each thread gets its own set
+        self._thread_local = threading.local()
 
         # Configure ONNX Runtime
-        self.session_options = ort.SessionOptions()
-        self.session_options.graph_optimization_level = (
-            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        )
-        self.session_options.intra_op_num_threads = os.cpu_count() or 4
+        self.share_resources = settings.SHARE_ORT_RESOURCES and _init_shared_resources()
+        self.session_options = self._create_session_options()
 
         # Load models
         self._load_models()
 
+    def _create_session_options(self) -> ort.SessionOptions:
+        """Create session options shared by all models"""
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # Keep ORT's memory plan stable once warmed up
+        session_options.enable_mem_pattern = True
+        session_options.enable_cpu_mem_arena = True
+
+        if self.share_resources:
+            # Thread counts come from the global pool (sized the same way);
+            # per-session thread settings would be ignored
+            session_options.use_per_session_threads = False
+            session_options.add_session_config_entry("session.use_env_allocators", "1")
+        else:
+            # Split the cores the container may use between uvicorn workers
+            # to avoid oversubscription; one model runs per request, so no
+            # inter-op parallelism
+            session_options.intra_op_num_threads = max(
+                1, _effective_cpus() // settings.UVICORN_WORKERS
+            )
+            session_options.inter_op_num_threads = 1
+            # Don't burn idle cores spinning between requests
+            session_options.add_session_config_entry(
+                "session.intra_op.allow_spinning", "0"
+            )
+        return session_options
+
+    def _create_onnx_session(self, model_path: str) -> ort.InferenceSession:
+        """
+        Create a session for an ONNX model, using a cached graph-optimized
+        copy of it when available
+
+        Args:
+            model_path: Path to the source ONNX model
+
+        Returns:
+            Inference session
+        """
+        opt_path = self._optimized_model_path(model_path)
+        if opt_path:
+            cache_fresh = self._is_cache_fresh(opt_path, model_path)
+            if not cache_fresh:
+                cache_fresh = self._write_optimized_model(model_path, opt_path)
+
+            if cache_fresh:
+                try:
+                    session = ort.InferenceSession(
+                        opt_path,
+                        sess_options=self.session_options,
+                        providers=["CPUExecutionProvider"],
+                    )
+                    logger.info(f"Using cached optimized model: {opt_path}")
+                    return session
+                except Exception as e:
+                    logger.warning(f"Ignoring unusable cached model {opt_path}: {e}")
+
+        return ort.InferenceSession(
+            model_path,
+            sess_options=self.session_options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    @staticmethod
+    def _optimized_model_path(model_path: str) -> Optional[str]:
+        """
+        Path of the cached optimized copy of a model, in
+        OPTIMIZED_MODEL_CACHE_DIR rather than next to the model (model
+        directories are usually mounted read-only)
+
+        The file name is keyed on the model's absolute path and the ORT
+        version, so different models or ORT upgrades never share a cache.
+
+        Returns:
+            Cache path, or None if caching is disabled or the cache
+            directory isn't writable
+        """
+        if not settings.CACHE_OPTIMIZED_MODELS:
+            return None
+
+        cache_dir = settings.OPTIMIZED_MODEL_CACHE_DIR
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Optimized model cache disabled: {e}")
+            return None
+        if not os.access(cache_dir, os.W_OK):
+            logger.warning(f"Optimized model cache dir not writable: {cache_dir}")
+            return None
+
+        key = hashlib.sha1(
+            f"{os.path.abspath(model_path)}|{ort.__version__}".encode()
+        ).hexdigest()[:12]
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(cache_dir, f"{name}.{key}.opt.onnx")
+
+    @staticmethod
+    def _is_cache_fresh(opt_path: str, model_path: str) -> bool:
+        """Whether the cached optimized model is newer than its source"""
+        return os.path.exists(opt_path) and (
+            os.path.getmtime(opt_path) >= os.path.getmtime(model_path)
+        )
+
+    def _write_optimized_model(self, model_path: str, opt_path: str) -> bool:
+        """
+        Serialize the graph-optimized model to opt_path
+
+        Only extended (hardware-independent) optimizations are serialized;
+        layout transforms tied to this CPU are still applied when the cached
+        graph is loaded. Each process writes to its own temp file and
+        atomically renames it, so concurrent workers never see a partial file.
+
+        Args:
+            model_path: Path to the source ONNX model
+            opt_path: Path to write the optimized model to
+
+        Returns:
+            True if the cache was written
+        """
+        tmp_path = f"{opt_path}.{os.getpid()}.tmp"
+        session_options = self._create_session_options()
+        session_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        )
+        session_options.optimized_model_filepath = tmp_path
+
+        try:
+            # ORT serializes the optimized graph as a side effect of loading
+            ort.InferenceSession(
+                model_path,
+                sess_options=session_options,
+                providers=["CPUExecutionProvider"],
+            )
+            os.replace(tmp_path, opt_path)
+            logger.info(f"Wrote optimized model to: {opt_path}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not cache optimized model {opt_path}: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     def _load_models(self):
         """Load all available ONNX models"""
         model_configs = {
@@ -56,12 +280,25 @@ class ModelInference:
                     logger.info(f"Skipping {model_name} model - file not found")
                     continue
 
-                # Load ONNX model
-                session = ort.InferenceSession(
-                    model_path,
-                    sess_options=self.session_options,
-                    providers=["CPUExecutionProvider"],
-                )
+                # Prefer the INT8 quantized graph if one was exported
+                int8_path = model_path.replace(".onnx", ".int8.onnx")
+                if settings.USE_INT8 and os.path.exists(int8_path):
+                    model_path = int8_path
+
+                # Prefer a pre-converted ORT format model if one exists
+                ort_path = model_path.replace(".onnx", ".ort")
+                if settings.USE_ORT_FORMAT and os.path.exists(ort_path):
+                    model_path = ort_path
+                    # ORT format is already optimized and loads without
+                    # protobuf parsing; detected from the .ort extension
+                    session = ort.InferenceSession(
+                        ort_path,
+                        sess_options=self.session_options,
+                        providers=["CPUExecutionProvider"],
+                    )
+                else:
+                    # Load ONNX model
+                    session = self._create_onnx_session(model_path)
 
                 self.models[model_name] = session
 
@@ -77,7 +314,9 @@ class ModelInference:
                     "output_name": output_name,
                     "output_shape": output_shape,
                     "input_size": config["input_size"],
+                    "layout": "NHWC" if input_shape[-1] == 3 else "NCHW",
                     "classes": config["classes"],
+                    "classes_tuple": tuple(config["classes"]),
                     "num_classes": len(config["classes"]),
                 }
 
@@ -99,7 +338,8 @@ class ModelInference:
         Run inference on preprocessed image
 
         Args:
-            image: Preprocessed image array (1, H, W, C)
+            image: Preprocessed float32 image array in the model's layout,
+                (1, C, H, W) or (1, H, W, C)
             model_name: Name of model to use
 
         Returns:
@@ -119,49 +359,31 @@ class ModelInference:
             input_name = metadata["input_name"]
             output_name = metadata["output_name"]
 
-            # Prepare input - ensure correct shape
-            # ONNX models often expect (batch, channels, height, width)
-            # Convert from (batch, height, width, channels) if needed
-            if len(image.shape) == 4 and image.shape[-1] == 3:
-                # Transpose from NHWC to NCHW
-                image = np.transpose(image, (0, 3, 1, 2))
-
-            # Ensure float32
-            image = image.astype(np.float32)
+            # Bind the input zero-copy (preprocessing already yields
+            # C-contiguous float32 in the model's layout) and the
+            # preallocated output buffer
+            image = np.ascontiguousarray(image, dtype=np.float32)
+            io_binding, output_buffer = self._get_io_binding(model_name)
+            io_binding.bind_cpu_input(input_name, image)
+            io_binding.bind_output(
+                output_name,
+                device_type="cpu",
+                element_type=np.float32,
+                shape=output_buffer.shape,
+                buffer_ptr=output_buffer.ctypes.data,
+            )
 
             # Run inference
-            outputs = session.run([output_name], {input_name: image})
+            session.run_with_iobinding(io_binding)
 
-            # Get predictions
-            predictions = outputs[0][0]  # Remove batch dimension
-
-            # Get class probabilities
-            if len(predictions.shape) == 1:
-                # Raw logits or probabilities
-                probabilities = self._softmax(predictions)
-            else:
-                probabilities = predictions
-
-            # Get top prediction
-            predicted_idx = int(np.argmax(probabilities))
-            confidence = float(probabilities[predicted_idx])
-            predicted_class = metadata["classes"][predicted_idx]
-
-            # Get all class probabilities
-            class_probabilities = {
-                metadata["classes"][i]: float(probabilities[i])
-                for i in range(len(metadata["classes"]))
-            }
+            # Get class probabilities from raw logits or probabilities
+            probabilities = self._softmax(output_buffer)
 
-            result = {
-                "predicted_class": predicted_class,
-                "confidence": confidence,
-                "class_probabilities": class_probabilities,
-                "disease": predicted_class,  # Alias for backend compatibility
-                "crop_type": model_name,
-            }
+            result = self._format_results(probabilities, model_name)[0]
 
-            logger.debug(f"Prediction: {predicted_class} ({confidence:.2%})")
+            logger.debug(
+                f"Prediction: {result['predicted_class']} ({result['confidence']:.2%})"
+            )
 
             return result
 
@@ -176,19 +398,122 @@ class ModelInference:
         Run batch inference
 
         Args:
-            images: Batch of preprocessed images (N, H, W, C)
+            images: Batch of preprocessed images in the model's layout,
+                (N, C, H, W) or (N, H, W, C)
             model_name: Name of model to use
 
         Returns:
             List of prediction dictionaries
         """
+        if model_name not in self.models:
+            raise ValueError(
+                f"Model '{model_name}' not found. "
+                f"Available models: {list(self.models.keys())}"
+            )
+
+        # Models exported with a fixed batch dimension can't take the whole
+        # batch in one run - fall back to one image at a time
+        batch_dim = self.model_metadata[model_name]["input_shape"][0]
+        if isinstance(batch_dim, int) and batch_dim != images.shape[0]:
+            return [
+                self.predict(images[i : i + 1], model_name)
+                for i in range(images.shape[0])
+            ]
+
+        try:
+            session = self.models[model_name]
+            metadata = self.model_metadata[model_name]
+
+            # Run the whole batch in a single session call
+            images = np.ascontiguousarray(images, dtype=np.float32)
+            outputs = session.run(
+                [metadata["output_name"]], {metadata["input_name"]: images}
+            )[0]
+
+            # Row-wise softmax over the class dimension
+            probabilities = self._softmax(outputs)
+
+            return self._format_results(probabilities, model_name)
+
+        except Exception as e:
+            logger.error(f"Batch inference error: {e}", exc_info=True)
+            raise RuntimeError(f"Batch inference failed: {str(e)}")
+
+    def _format_results(
+        self, probabilities: np.ndarray, model_name: str
+    ) -> list[Dict[str, Any]]:
+        """Build prediction responses from (N, num_classes) probabilities"""
+        classes = self.model_metadata[model_name]["classes_tuple"]
+
+        # One C-level conversion to Python floats; with a handful of classes
+        # plain list operations beat further numpy round trips
         results = []
-        for i in range(images.shape[0]):
-            image = np.expand_dims(images[i], axis=0)
-            result = self.predict(image, model_name)
-            results.append(result)
+        for row in probabilities.tolist():
+            confidence = max(row)
+            predicted_class = classes[row.index(confidence)]
+            results.append(
+                {
+                    "predicted_class": predicted_class,
+                    "confidence": confidence,
+                    "class_probabilities": dict(zip(classes, row)),
+                    "disease": predicted_class,  # Alias for backend compatibility
+                    "crop_type": model_name,
+                }
+            )
         return results
 
+    def _get_io_binding(self, model_name: str) -> Tuple[ort.IOBinding, np.ndarray]:
+        """Get this thread's IOBinding and output buffer for a model"""
+        bindings = getattr(self._thread_local, "bindings", None)
+        if bindings is None:
+            bindings = self._thread_local.bindings = {}
+
+        if model_name not in bindings:
+            bindings[model_name] = (
+                self.models[model_name].io_binding(),
+                np.empty(
+                    (1, self.model_metadata[model_name]["num_classes"]),
+                    dtype=np.float32,
+                ),
+            )
+        return bindings[model_name]
+
+    def warmup(self, runs: int = 2, batch_sizes: Tuple[int, ...] = (1,)):
+        """
+        Run dummy inferences so the first real request doesn't pay for
+        ORT's lazy arena allocation and kernel setup
+
+        Both the single-image (IOBinding) path and the batched path are
+        warmed, the latter at each of batch_sizes.
+
+        Args:
+            runs: Number of dummy inferences per model and path
+            batch_sizes: Batch sizes to warm predict_batch at
+        """
+        for model_name in self.models:
+            height, width = self.get_input_size(model_name)
+            if self.get_input_layout(model_name) == "NHWC":
+                image_shape = (height, width, 3)
+            else:
+                image_shape = (3, height, width)
+
+            try:
+                start = time.perf_counter()
+                dummy = np.zeros((1,) + image_shape, dtype=np.float32)
+                for _ in range(runs):
+                    self.predict(dummy, model_name)
+                for batch_size in batch_sizes:
+                    dummy = np.zeros((batch_size,) + image_shape, dtype=np.float32)
+                    for _ in range(runs):
+                        self.predict_batch(dummy, model_name)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                logger.info(
+                    f"🔥 Warmed up {model_name} model "
+                    f"(batch sizes {list(batch_sizes)}, {elapsed_ms:.0f} ms)"
+                )
+            except Exception as e:
+                logger.warning(f"Warmup failed for {model_name} model: {e}")
+
     def get_model_info(self) -> Dict[str, Dict[str, Any]]:
         """Get information about loaded models"""
         return {
@@ -196,6 +521,7 @@ class ModelInference:
                 "input_shape": meta["input_shape"],
                 "output_shape": meta["output_shape"],
                 "input_size": meta["input_size"],
+                "layout": meta["layout"],
                 "classes": meta["classes"],
                 "num_classes": meta["num_classes"],
             }
@@ -208,14 +534,27 @@ class ModelInference:
             raise ValueError(f"Model '{model_name}' not found")
         return self.model_metadata[model_name]["input_size"]
 
+    def get_input_layout(self, model_name: str) -> str:
+        """Get expected input layout ('NCHW' or 'NHWC') for a model"""
+        if model_name not in self.model_metadata:
+            raise ValueError(f"Model '{model_name}' not found")
+        return self.model_metadata[model_name]["layout"]
+
+    def supports_batching(self, model_name: str) -> bool:
+        """Whether a model takes more than one image per run (dynamic batch)"""
+        if model_name not in self.model_metadata:
+            raise ValueError(f"Model '{model_name}' not found")
+        return not isinstance(self.model_metadata[model_name]["input_shape"][0], int)
+
     @staticmethod
     def _softmax(x: np.ndarray) -> np.ndarray:
-        """Apply softmax to convert logits to probabilities"""
-        exp_x = np.exp(x - np.max(x))
-        return exp_x / exp_x.sum()
+        """Apply softmax over the last axis to convert logits to probabilities"""
+        exp_x = np.exp(x - np.max(x, axis=-1, keepdims=True))
+        return exp_x / exp_x.sum(axis=-1, keepdims=True)
 
     def cleanup(self):
         """Cleanup resources"""
         logger.info("Cleaning up model resources...")
         self.models.clear()
         self.model_metadata.clear()
+        self._thread_local = threading.local()
@@ -0,0 +1,169 @@
+"""
+Request-level micro-batching for single-image predictions
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-image requests into one model call. Requests
+    that queue up while a batch is running are collected (for up to
+    max_wait_ms) into the next one; a request on an idle server runs at once
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[np.ndarray, str], List[Dict[str, Any]]],
+        executor: Optional[Executor] = None,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+    ):
+        """
+        Args:
+            predict_batch: Blocking batch predictor taking (batch, model_name)
+            executor: Executor to run predict_batch on (default: the loop's)
+            max_batch_size: Maximum number of images per batch
+            max_wait_ms: How long to wait for more requests after the first,
+                while another batch is running
+        """
+        self.predict_batch = predict_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # Batches currently running
+        self._dispatches: Set[asyncio.Task] = set()
+        # Free batch arrays per model, reused across batches
+        self._buffers: Dict[str, List[np.ndarray]] = defaultdict(list)
+
+    def start(self):
+        """Start the background batching loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop and fail any requests still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for task in list(self._dispatches):
+            task.cancel()
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference API shutting down"))
+
+    async def predict(self, image: np.ndarray, model_name: str) -> Dict[str, Any]:
+        """
+        Queue one preprocessed image (batch of one) and wait for its result
+
+        Args:
+            image: Preprocessed image array with a batch dimension of 1
+            model_name: Name of the model to use
+
+        Returns:
+            Dictionary with prediction results
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, model_name, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[np.ndarray, str, asyncio.Future]]:
+        """
+        Wait for a request and take whatever else is already queued. Only
+        while a batch is running (so the executor is busy anyway) is the
+        window held open for more requests; an idle server dispatches at once
+        """
+        items = [await self._queue.get()]
+        while len(items) < self.max_batch_size and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+
+        if self._dispatches:
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+        return items
+
+    def _take_buffer(self, model_name: str, image: np.ndarray) -> np.ndarray:
+        """Get a free batch array for the model, allocating one if needed"""
+        shape = (self.max_batch_size,) + image.shape[1:]
+        free = self._buffers[model_name]
+        while free:
+            buffer = free.pop()
+            if buffer.shape == shape and buffer.dtype == image.dtype:
+                return buffer
+        return np.empty(shape, image.dtype)
+
+    @staticmethod
+    def _fail(futures: List[asyncio.Future], error: Exception):
+        """Fail every request of a batch that is still waiting"""
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _dispatch(
+        self, model_name: str, entries: List[Tuple[np.ndarray, asyncio.Future]]
+    ):
+        """Run one batch for a model and resolve its requests' futures"""
+        futures = [future for _, future in entries]
+        images = [image for image, _ in entries]
+        buffer = self._take_buffer(model_name, images[0])
+        try:
+            batch = np.concatenate(images, out=buffer[: len(images)])
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.predict_batch, batch, model_name
+            )
+        except asyncio.CancelledError:
+            self._fail(futures, RuntimeError("Inference API shutting down"))
+            raise
+        except Exception as e:
+            self._fail(futures, e)
+            return
+        finally:
+            self._buffers[model_name].append(buffer)
+
+        logger.debug(f"Micro-batch of {len(entries)} for {model_name}")
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self):
+        """Batching loop - one model call per model name per batch"""
+        while True:
+            items = await self._collect()
+
+            by_model = defaultdict(list)
+            for image, model_name, future in items:
+                # Skip requests whose client already went away
+                if not future.done():
+                    by_model[model_name].append((image, future))
+
+            # Batches run concurrently on the executor; the loop goes straight
+            # back to collecting the next one
+            for model_name, entries in by_model.items():
+                task = asyncio.create_task(self._dispatch(model_name, entries))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
@@ -11,11 +11,22 @@ import cv2
 
 logger = logging.getLogger(__name__)
 
+# libjpeg-turbo is optional - preprocess_image_turbo falls back to OpenCV
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError) as e:
+    logger.info(f"TurboJPEG unavailable, using OpenCV for JPEG decoding: {e}")
+    _turbo_jpeg = None
+
 
 def preprocess_image(
     image_bytes: bytes,
     target_size: Tuple[int, int] = (224, 224),
     normalize: bool = True,
+    layout: str = "NCHW",
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """
     Preprocess image for model inference
@@ -24,9 +35,13 @@ def preprocess_image(
         image_bytes: Raw image bytes
         target_size: Target size (height, width)
         normalize: Whether to normalize pixel values to [0, 1]
+        layout: Output layout expected by the model ('NCHW' or 'NHWC')
+        out: Optional preallocated float32 array of the output shape to
+            write into (e.g. one row of a batch)
 
     Returns:
-        Preprocessed image as numpy array with shape (1, height, width, channels)
+        Preprocessed float32 image as numpy array with shape (1, C, H, W)
+        or (1, H, W, C) depending on layout
     """
     try:
         # Open image
@@ -36,18 +51,12 @@ def preprocess_image(
         if image.mode != "RGB":
             image = image.convert("RGB")
 
-        # Resize image
-        image = image.resize(target_size, Image.Resampling.LANCZOS)
-
-        # Convert to numpy array
-        img_array = np.array(image, dtype=np.float32)
+        # Resize image (PIL expects (width, height))
+        height, width = target_size
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
 
-        # Normalize if requested
-        if normalize:
-            img_array = img_array / 255.0
-
-        # Add batch dimension (1, height, width, channels)
-        img_array = np.expand_dims(img_array, axis=0)
+        # View the pixels as uint8 (H, W, C) without copying
+        img_array = _to_tensor(np.asarray(image), normalize, layout, out)
 
         logger.debug(f"Preprocessed image shape: {img_array.shape}")
 
@@ -62,17 +71,23 @@ def preprocess_image_cv2(
     image_bytes: bytes,
     target_size: Tuple[int, int] = (224, 224),
     normalize: bool = True,
+    layout: str = "NCHW",
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """
-    Preprocess image using OpenCV (alternative method)
+    Preprocess image using OpenCV (default method)
 
     Args:
         image_bytes: Raw image bytes
         target_size: Target size (height, width)
         normalize: Whether to normalize pixel values
+        layout: Output layout expected by the model ('NCHW' or 'NHWC')
+        out: Optional preallocated float32 array of the output shape to
+            write into (e.g. one row of a batch)
 
     Returns:
-        Preprocessed image as numpy array
+        Preprocessed float32 image as numpy array with shape (1, C, H, W)
+        or (1, H, W, C) depending on layout
     """
     try:
         # Decode image
@@ -85,26 +100,127 @@ def preprocess_image_cv2(
         # Convert BGR to RGB
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        # Resize
-        image = cv2.resize(image, target_size, interpolation=cv2.INTER_LANCZOS4)
+        return _resize_to_tensor(image, target_size, normalize, layout, out)
 
-        # Convert to float32
-        img_array = image.astype(np.float32)
+    except Exception as e:
+        logger.error(f"Error preprocessing image with CV2: {e}")
+        raise ValueError(f"Failed to preprocess image: {str(e)}")
 
-        # Normalize
-        if normalize:
-            img_array = img_array / 255.0
 
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
+def preprocess_image_turbo(
+    image_bytes: bytes,
+    target_size: Tuple[int, int] = (224, 224),
+    normalize: bool = True,
+    layout: str = "NCHW",
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Preprocess image using libjpeg-turbo for JPEG decoding
 
-        return img_array
+    Large JPEGs are downscaled during decoding (1/2, 1/4 or 1/8 in the DCT
+    domain) so only the residual resize is left to OpenCV. Non-JPEG images,
+    or a missing libjpeg-turbo, fall back to preprocess_image_cv2.
+
+    Args:
+        image_bytes: Raw image bytes
+        target_size: Target size (height, width)
+        normalize: Whether to normalize pixel values
+        layout: Output layout expected by the model ('NCHW' or 'NHWC')
+        out: Optional preallocated float32 array of the output shape to
+            write into (e.g. one row of a batch)
+
+    Returns:
+        Preprocessed float32 image as numpy array with shape (1, C, H, W)
+        or (1, H, W, C) depending on layout
+    """
+    if _turbo_jpeg is None or not image_bytes.startswith(b"\xff\xd8"):
+        return preprocess_image_cv2(image_bytes, target_size, normalize, layout, out)
+
+    try:
+        image = _decode_jpeg_scaled(image_bytes, target_size)
+        return _resize_to_tensor(image, target_size, normalize, layout, out)
 
     except Exception as e:
-        logger.error(f"Error preprocessing image with CV2: {e}")
+        logger.error(f"Error preprocessing image with TurboJPEG: {e}")
         raise ValueError(f"Failed to preprocess image: {str(e)}")
 
 
+def _decode_jpeg_scaled(image_bytes: bytes, target_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Decode a JPEG to uint8 RGB (H, W, C) with libjpeg-turbo, using the
+    strongest DCT scaling that still leaves it at least as large as the target
+    """
+    height, width = target_size
+    src_width, src_height, _, _ = _turbo_jpeg.decode_header(image_bytes)
+
+    scaling_factor = (1, 1)
+    for num, denom in _turbo_jpeg.scaling_factors:
+        scaled_width = -(-src_width * num // denom)
+        scaled_height = -(-src_height * num // denom)
+        if (
+            scaled_width >= width
+            and scaled_height >= height
+            and num / denom < scaling_factor[0] / scaling_factor[1]
+        ):
+            scaling_factor = (num, denom)
+
+    return _turbo_jpeg.decode(
+        image_bytes, pixel_format=TJPF_RGB, scaling_factor=scaling_factor
+    )
+
+
+def _resize_to_tensor(
+    image: np.ndarray,
+    target_size: Tuple[int, int],
+    normalize: bool,
+    layout: str,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Resize a uint8 RGB (H, W, C) image and convert it to a float32 batch"""
+    # Resize - INTER_AREA for downscaling, LANCZOS only when upscaling
+    height, width = target_size
+    if image.shape[0] >= height and image.shape[1] >= width:
+        interpolation = cv2.INTER_AREA
+    else:
+        interpolation = cv2.INTER_LANCZOS4
+    image = cv2.resize(image, (width, height), interpolation=interpolation)
+
+    return _to_tensor(image, normalize, layout, out)
+
+
+def _to_tensor(
+    image: np.ndarray,
+    normalize: bool,
+    layout: str,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Write a uint8 RGB (H, W, C) image into a float32 batch of one (out, or
+    a new array), scaling and (for NCHW) transposing in a single pass
+    """
+    height, width = image.shape[:2]
+
+    if layout == "NHWC":
+        shape = (1, height, width, 3)
+    elif layout == "NCHW":
+        shape = (1, 3, height, width)
+    else:
+        raise ValueError(f"Unsupported layout: {layout}")
+
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    elif out.shape != shape or out.dtype != np.float32:
+        raise ValueError(f"Output buffer must be float32 {shape}, got {out.shape}")
+
+    target = out[0] if layout == "NHWC" else out[0].transpose(1, 2, 0)
+    if normalize:
+        np.multiply(image, np.float32(1 / 255), out=target)
+    else:
+        np.copyto(target, image)
+
+    return out
+
+
 def validate_image(
     image_bytes: bytes,
     max_size: int = 10 * 1024 * 1024,
@@ -149,13 +265,16 @@ def validate_image(
         raise ValueError(f"Invalid image file: {str(e)}")
 
 
-def augment_image(img_array: np.ndarray, augmentation_type: str = "none") -> np.ndarray:
+def augment_image(
+    img_array: np.ndarray, augmentation_type: str = "none", layout: str = "NCHW"
+) -> np.ndarray:
     """
     Apply augmentation to image (for testing or ensemble predictions)
 
     Args:
-        img_array: Image array
+        img_array: Image array with shape (1, C, H, W) or (1, H, W, C)
         augmentation_type: Type of augmentation ('none', 'flip', 'rotate', 'brighten')
+        layout: Layout of img_array ('NCHW' or 'NHWC')
 
     Returns:
         Augmented image array
@@ -163,13 +282,21 @@ def augment_image(img_array: np.ndarray, augmentation_type: str = "none") -> np.
     if augmentation_type == "none":
         return img_array
 
+    # Spatial (height, width) axes once the batch dimension is removed
+    if layout == "NCHW":
+        height_axis, width_axis = 1, 2
+    elif layout == "NHWC":
+        height_axis, width_axis = 0, 1
+    else:
+        raise ValueError(f"Unsupported layout: {layout}")
+
     # Remove batch dimension for processing
     img = img_array[0]
 
     if augmentation_type == "flip":
-        img = np.fliplr(img)
+        img = np.flip(img, axis=width_axis)
     elif augmentation_type == "rotate":
-        img = np.rot90(img)
+        img = np.rot90(img, axes=(height_axis, width_axis))
     elif augmentation_type == "brighten":
         img = np.clip(img * 1.2, 0, 1)
 